@@ -0,0 +1,517 @@
+"""Offline batch evaluation for the Teachable Machine control pages.
+
+Runs the image, pose or voice model over a directory of recorded clips instead
+of a live webcam/microphone, using the same model id, label mapping, threshold
+and publish throttle as the matching Streamlit page.
+
+Clips are grouped by their expected command, one sub-folder per label:
+
+    clips/
+      F/  run1.mp4  run2.mp4
+      S/  idle.mp4
+      ...
+
+Usage:
+    python evaluate.py image clips/
+    python evaluate.py pose  clips/ --posenet posenet_savedmodel/
+    python evaluate.py voice clips/ --model-id NEWMODEL --threshold 0.8
+
+Needs the offline extras, which are not part of the Streamlit deployment:
+    pip install tensorflow tensorflowjs opencv-python-headless
+
+Pose mode also needs tmPose's PoseNet converted to a SavedModel; the README
+shows how to fetch and convert it.
+"""
+import argparse
+import ast
+import importlib.util
+import json
+import os
+import threading
+import time
+import urllib.request
+import wave
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+
+# ========== CONFIG ==========
+HERE = Path(__file__).resolve().parent
+PAGES = {                                # mode -> page whose CONFIG block is mirrored
+    "image": HERE / "image_control.py",
+    "pose":  HERE / "pose_control.py",
+    "voice": HERE / "voice_control.py",
+}
+VIDEO_EXT = {".mp4", ".avi", ".mov", ".mkv", ".webm"}
+AUDIO_EXT = {".wav"}
+MODEL_BASE = "https://teachablemachine.withgoogle.com/models/{}/"
+CACHE_DIR = Path(os.environ.get("TM_CACHE_DIR", Path.home() / ".cache" / "robotcar_tm"))
+AUDIO_RATE = 44100                       # AudioContext rate assumed by BROWSER_FFT
+FFT_SIZE = 1024                          # speech-commands analyser fftSize
+OVERLAP_FACTOR = 0.5                     # same as recognizer.listen() on the voice page
+# ============================
+
+
+def page_config(page):
+    """Read the literal constants from a page's CONFIG block without running Streamlit."""
+    cfg = {}
+    for node in ast.parse(Path(page).read_text(encoding="utf-8")).body:
+        if not isinstance(node, ast.Assign):
+            continue
+        try:
+            value = ast.literal_eval(node.value)
+        except ValueError:
+            continue                     # f-strings such as TOPIC_CMD
+        for target in node.targets:
+            if isinstance(target, ast.Name):
+                cfg[target.id] = value
+            elif isinstance(target, ast.Tuple):
+                cfg.update({t.id: v for t, v in zip(target.elts, value)})
+    return cfg
+
+
+def _download(url, path):
+    # write to a side file and rename, so an interrupted download is never cached
+    if path.exists():
+        return
+    part = path.with_name(path.name + ".part")
+    try:
+        urllib.request.urlretrieve(url, part)
+        os.replace(part, path)
+    finally:
+        part.unlink(missing_ok=True)
+
+
+def fetch_model(model_id):
+    """Download model.json, metadata.json and weights for a model id into the cache."""
+    dest = CACHE_DIR / model_id
+    dest.mkdir(parents=True, exist_ok=True)
+    base = MODEL_BASE.format(model_id)
+    for name in ("model.json", "metadata.json"):
+        _download(base + name, dest / name)
+    manifest = json.loads((dest / "model.json").read_text())["weightsManifest"]
+    for group in manifest:
+        for name in group["paths"]:
+            _download(base + name, dest / name)
+    return dest
+
+
+def check_dependencies(mode):
+    """Fail in the parent, before any worker spawns, if the offline extras are missing."""
+    needed = {"tensorflow": "tensorflow", "tensorflowjs": "tensorflowjs"}
+    if mode != "voice":
+        needed["cv2"] = "opencv-python-headless"
+    missing = [pkg for module, pkg in needed.items() if importlib.util.find_spec(module) is None]
+    if missing:
+        raise SystemExit(f"{mode} evaluation needs: pip install {' '.join(missing)}")
+
+
+def available_cores():
+    # the cores this process may run on (cgroup/affinity aware), not the host's total
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def to_label(name):
+    # mirrors className.trim().toUpperCase() in the pages
+    return name.strip().upper()
+
+
+# ---------- decoding ----------
+
+class ClipError(ValueError):
+    """A clip that cannot be decoded; it is reported as skipped, not fatal."""
+
+
+DECODE_ERRORS = (ClipError, wave.Error, EOFError)
+
+
+def stream_video(path, batch_size, prepare):
+    """Yield (timestamps_ms, batch) with frames passed through ``prepare``."""
+    import cv2
+    cap = cv2.VideoCapture(str(path))
+    if not cap.isOpened():
+        raise ClipError(f"cannot open video {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    times, frames, index = [], [], 0
+    try:
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            times.append(index * 1000.0 / fps)
+            frames.append(prepare(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+            index += 1
+            if len(frames) == batch_size:
+                yield np.asarray(times), np.stack(frames)
+                times, frames = [], []
+    finally:
+        cap.release()
+    if frames:
+        yield np.asarray(times), np.stack(frames)
+
+
+def read_wav(path):
+    """Mono float32 samples resampled to AUDIO_RATE."""
+    with wave.open(str(path), "rb") as wav:
+        width, channels, rate = wav.getsampwidth(), wav.getnchannels(), wav.getframerate()
+        raw = wav.readframes(wav.getnframes())
+    if width == 1:
+        samples = (np.frombuffer(raw, np.uint8).astype(np.float32) - 128) / 128
+    elif width == 3:
+        # little-endian 24-bit PCM: place each sample in the top 3 bytes of an int32
+        padded = np.zeros((len(raw) // 3, 4), np.uint8)
+        padded[:, 1:] = np.frombuffer(raw, np.uint8).reshape(-1, 3)
+        samples = (padded.view("<i4")[:, 0] >> 8).astype(np.float32) / (2 ** 23 - 1)
+    elif width in (2, 4):
+        dtype = np.int16 if width == 2 else np.int32
+        samples = np.frombuffer(raw, dtype).astype(np.float32) / np.iinfo(dtype).max
+    else:
+        raise ClipError(f"unsupported {8 * width}-bit wav {path}")
+    samples = samples.reshape(-1, channels).mean(axis=1)
+    if rate != AUDIO_RATE:
+        n = int(round(len(samples) * AUDIO_RATE / rate))
+        samples = np.interp(np.linspace(0, len(samples) - 1, n), np.arange(len(samples)), samples)
+    return samples.astype(np.float32)
+
+
+def js_round(x):
+    # Math.round rounds halves up; Python's round() rounds them to even
+    return int(np.floor(x + 0.5))
+
+
+def stream_audio(path, batch_size, num_frames, num_bins):
+    """Yield (timestamps_ms, batch) of normalised spectrogram windows like BROWSER_FFT."""
+    samples = read_wav(path)
+    count = len(samples) // FFT_SIZE
+    if count < num_frames:
+        raise ClipError(f"too short: {len(samples) / AUDIO_RATE:.2f}s, the model needs "
+                        f"{num_frames * FFT_SIZE / AUDIO_RATE:.2f}s")
+    # AnalyserNode.getFloatFrequencyData: Blackman window, |X|/N in dB, no smoothing
+    chunks = samples[: count * FFT_SIZE].reshape(count, FFT_SIZE) * np.blackman(FFT_SIZE)
+    mags = np.abs(np.fft.rfft(chunks, axis=1))[:, :num_bins] / FFT_SIZE
+    spec = 20 * np.log10(np.maximum(mags, 1e-10)).astype(np.float32)
+    hop = max(1, js_round(num_frames * (1 - OVERLAP_FACTOR)))
+    frame_ms = 1000.0 * FFT_SIZE / AUDIO_RATE
+    starts = range(0, count - num_frames + 1, hop)
+    times, windows = [], []
+    for start in starts:
+        window = spec[start:start + num_frames]
+        windows.append(((window - window.mean()) / (window.std() or 1.0))[..., None])
+        times.append((start + num_frames) * frame_ms)
+        if len(windows) == batch_size:
+            yield np.asarray(times), np.stack(windows)
+            times, windows = [], []
+    if windows:
+        yield np.asarray(times), np.stack(windows)
+
+
+# ---------- preprocessing ----------
+
+def crop_to_aspect(frame, aspect):
+    h, w = frame.shape[:2]
+    if w / h > aspect:
+        cw = int(round(h * aspect))
+        return frame[:, (w - cw) // 2:(w - cw) // 2 + cw]
+    ch = int(round(w / aspect))
+    return frame[(h - ch) // 2:(h - ch) // 2 + ch]
+
+
+def webcam_canvas(frame, video_w, video_h):
+    """What tm{Image,Pose}.Webcam(video_w, video_h, flip=true) draws on its canvas.
+
+    cropTo() scales the centre square of the camera to video_w x video_w, mirrors
+    it and draws it at (0,0), so the canvas keeps only the top video_h rows.
+    """
+    h, w = frame.shape[:2]
+    side = min(h, w)
+    top, left = (h - side) // 2, (w - side) // 2
+    rows = int(round(side * video_h / video_w))
+    return frame[top:top + rows, left:left + side][:, ::-1]
+
+
+def image_prepare(cfg, size):
+    """Webcam canvas, then the centre square tmImage's predict() crops from it."""
+    import cv2
+
+    def prepare(frame):
+        frame = crop_to_aspect(webcam_canvas(frame, cfg["VIDEO_W"], cfg["VIDEO_H"]), 1.0)
+        frame = cv2.resize(np.ascontiguousarray(frame), (size, size), interpolation=cv2.INTER_AREA)
+        return frame.astype(np.float32) / 127.5 - 1
+    return prepare
+
+
+def pose_prepare(cfg, resolution):
+    """Webcam canvas, then PoseNet's pad-and-resize to a square input."""
+    import cv2
+
+    def prepare(frame):
+        frame = np.ascontiguousarray(webcam_canvas(frame, cfg["VIDEO_W"], cfg["VIDEO_H"]))
+        h, w = frame.shape[:2]
+        side = max(h, w)
+        top, left = (side - h) // 2, (side - w) // 2
+        frame = cv2.copyMakeBorder(frame, top, side - h - top, left, side - w - left,
+                                   cv2.BORDER_CONSTANT, value=0)
+        frame = cv2.resize(frame, (resolution, resolution), interpolation=cv2.INTER_AREA)
+        return frame.astype(np.float32) / 127.5 - 1
+    return prepare
+
+
+# ---------- PoseNet ----------
+
+def posenet_settings(meta):
+    # tmPose's defaults when metadata.json has no modelSettings block
+    settings = {"architecture": "MobileNetV1", "outputStride": 16, "inputResolution": 257, "multiplier": 0.75}
+    settings.update(meta.get("modelSettings", {}).get("posenet", {}))
+    return settings
+
+
+def check_posenet(settings, input_shape, output_shapes, feature_len):
+    """Return why a PoseNet SavedModel does not match the TM pose model, or None."""
+    res, stride = settings["inputResolution"], settings["outputStride"]
+    side = (res - 1) // stride + 1
+    want = f"MobileNetV1 stride {stride} at {res}x{res} (multiplier {settings['multiplier']})"
+    if len(input_shape) == 4 and None not in input_shape[1:3] and tuple(input_shape[1:3]) != (res, res):
+        return f"--posenet takes {tuple(input_shape[1:3])} inputs, the pose model was trained on {want}"
+    channels = {shape[-1]: shape for shape in output_shapes if shape}
+    if 17 not in channels or 34 not in channels:
+        return "--posenet has no heatmap (17) and offset (34) outputs; is it a PoseNet?"
+    spatial = tuple(channels[17][1:3])
+    if None not in spatial and spatial != (side, side):
+        return f"--posenet outputs a {spatial} grid, the pose model expects {side}x{side} from {want}"
+    if side * side * (17 + 34) != feature_len:
+        return (f"the pose model takes {feature_len} features, but {want} gives "
+                f"{side * side * (17 + 34)}; metadata.json and the classifier disagree")
+    return None
+
+
+# ---------- worker ----------
+
+_worker = {}
+
+
+def _load_layers_model(model_dir, threads):
+    import tensorflow as tf
+    import tensorflowjs as tfjs
+    tf.config.threading.set_intra_op_parallelism_threads(threads)   # share the cores between workers
+    tf.config.threading.set_inter_op_parallelism_threads(threads)
+    return tf, tfjs.converters.load_keras_model(str(Path(model_dir) / "model.json"))
+
+
+def _init_worker(ready, threads, mode, cfg, model_dir, posenet_dir, batch_size):
+    _worker["ready"] = ready
+    tf, model = _load_layers_model(model_dir, threads)
+    meta = json.loads((Path(model_dir) / "metadata.json").read_text())
+    labels = [to_label(name) for name in meta.get("wordLabels") or meta["labels"]]
+
+    if mode == "image":
+        prepare = image_prepare(cfg, meta.get("imageSize", 224))
+        stream = lambda path: stream_video(path, batch_size, prepare)
+        predict = lambda batch: model.predict_on_batch(batch)
+    elif mode == "pose":
+        posenet = tf.saved_model.load(str(posenet_dir)).signatures["serving_default"]
+        # signatures are keyword-only; exported PoseNets often fix the batch dimension at 1
+        (input_name, input_spec), = posenet.structured_input_signature[1].items()
+        per_frame = input_spec.shape.rank and input_spec.shape[0] == 1
+        settings = posenet_settings(meta)
+        dims = lambda shape: shape.as_list() if shape.rank is not None else []
+        _worker["problem"] = check_posenet(settings, dims(input_spec.shape),
+                                           [dims(t.shape) for t in posenet.structured_outputs.values()],
+                                           model.input_shape[-1])
+        prepare = pose_prepare(cfg, settings["inputResolution"])
+        stream = lambda path: stream_video(path, batch_size, prepare)
+
+        def pose_features(frames):
+            # tmPose feeds the classifier concat(sigmoid(heatmaps), offsets), flattened
+            outputs = posenet(**{input_name: tf.cast(frames, input_spec.dtype)})
+            outputs = {t.shape[-1]: t for t in outputs.values()}
+            heatmaps, offsets = tf.sigmoid(outputs[17]), outputs[34]
+            return tf.reshape(tf.concat([heatmaps, offsets], axis=-1), (len(frames), -1))
+
+        def predict(batch):
+            if per_frame:
+                features = tf.concat([pose_features(batch[i:i + 1]) for i in range(len(batch))], axis=0)
+            else:
+                features = pose_features(batch)
+            return model.predict_on_batch(features)
+    else:
+        _, num_frames, num_bins, _ = model.input_shape
+        stream = lambda path: stream_audio(path, batch_size, num_frames, num_bins)
+        predict = lambda batch: model.predict_on_batch(batch)
+
+    _worker.update(labels=labels, stream=stream, predict=predict)
+
+
+def _warm(_):
+    # one call per worker: blocks until every worker has finished loading its models
+    try:
+        _worker["ready"].wait(timeout=600)
+    except threading.BrokenBarrierError:
+        pass
+    return _worker.get("problem")
+
+
+def simulate_publishes(times, labels, probs, threshold, interval_ms):
+    """Replay publishIfNeeded()/maybePublish() from the pages over one clip."""
+    sent, last_label, last_sent = [], "", -float("inf")
+    for now, label, prob in zip(times, labels, probs):
+        if prob < threshold:
+            continue
+        if label and (label != last_label or now - last_sent > interval_ms):
+            sent.append(label)
+            last_label, last_sent = label, now
+    return sent
+
+
+def _run_clip(job):
+    path, truth, threshold, interval_ms = job
+    labels = _worker["labels"]
+    times, predicted, probs, infer_s = [], [], [], 0.0
+    batches = _worker["stream"](path)
+    while True:
+        # only decoding is guarded: an inference error hits every clip and must stop the run
+        try:
+            batch_times, batch = next(batches)
+        except StopIteration:
+            break
+        except DECODE_ERRORS as err:
+            return {"path": str(path), "truth": truth, "error": f"{type(err).__name__}: {err}"}
+        start = time.perf_counter()
+        scores = np.asarray(_worker["predict"](batch))
+        infer_s += time.perf_counter() - start
+        top = scores.argmax(axis=1)
+        times.extend(batch_times.tolist())
+        predicted.extend(labels[i] for i in top)
+        probs.extend(scores[np.arange(len(top)), top].tolist())
+    return {
+        "path": str(path),
+        "truth": truth,
+        "predicted": predicted,
+        "below_threshold": sum(p < threshold for p in probs),
+        "published": simulate_publishes(times, predicted, probs, threshold, interval_ms),
+        "infer_s": infer_s,
+    }
+
+
+# ---------- report ----------
+
+def collect_clips(clip_dir, mode):
+    exts = AUDIO_EXT if mode == "voice" else VIDEO_EXT
+    clips = []
+    for label_dir in sorted(p for p in Path(clip_dir).iterdir() if p.is_dir()):
+        for clip in sorted(label_dir.rglob("*")):
+            if clip.suffix.lower() in exts:
+                clips.append((clip, to_label(label_dir.name)))
+    return clips
+
+
+def report(results, wall_s, startup_s, workers):
+    """Print the summary; returns False if any clip was skipped or nothing was evaluated."""
+    skipped = [r for r in results if "error" in r]
+    results = [r for r in results if "error" not in r]
+    confusion = Counter()
+    for r in results:
+        confusion.update((r["truth"], p) for p in r["predicted"])
+    total = sum(confusion.values())
+    correct = sum(n for (t, p), n in confusion.items() if t == p)
+    infer_s = sum(r["infer_s"] for r in results)
+    published = Counter((r["truth"], label) for r in results for label in r["published"])
+    below = sum(r["below_threshold"] for r in results)
+
+    print(f"clips: {len(results)}   skipped: {len(skipped)}   predictions: {total}   workers: {workers}")
+    for r in skipped:
+        print(f"  skipped {r['path']}: {r['error']}")
+    if not total:
+        print("no frames decoded")
+        return False
+    print(f"accuracy: {correct / total:.2%}")
+
+    truths = sorted({t for t, _ in confusion})
+    preds = sorted({p for _, p in confusion} | set(truths))
+    width = max(6, *(len(l) + 1 for l in preds))
+    print("\nconfusion (rows = expected, cols = predicted):")
+    print(" " * width + "".join(p.rjust(width) for p in preds) + "recall".rjust(width + 3))
+    for t in truths:
+        row = [confusion[t, p] for p in preds]
+        recall = confusion[t, t] / (sum(row) or 1)
+        print(t.ljust(width) + "".join(str(n).rjust(width) for n in row) + f"{recall:>{width + 3}.1%}")
+
+    print(f"\nthroughput: {total / wall_s:.1f} predictions/s wall "
+          f"({total / (infer_s or 1e-9):.1f}/s per inference-second, {wall_s:.1f}s evaluating, "
+          f"{startup_s:.1f}s worker startup)")
+    print(f"below threshold: {below} ({below / total:.1%})")
+    sent = sum(published.values())
+    wrong = sum(n for (t, p), n in published.items() if t != p)
+    print(f"simulated publishes: {sent}   wrong command: {wrong} ({wrong / (sent or 1):.1%})")
+    for t in sorted({t for t, _ in published}):
+        stray = {p: n for (e, p), n in published.items() if e == t and p != t}
+        detail = "  ".join(f"{p}={n}" for p, n in sorted(stray.items()))
+        print(f"  {t.ljust(width)}right {published[t, t]:<6}wrong {sum(stray.values()):<6}{detail}")
+    return not skipped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate a Teachable Machine control model on recorded clips.")
+    parser.add_argument("mode", choices=sorted(PAGES))
+    parser.add_argument("clips", help="directory with one sub-folder of clips per expected label")
+    parser.add_argument("--model-id", help="Teachable Machine model id (default: the page's MODEL_ID)")
+    parser.add_argument("--model-dir", help="local folder with model.json/metadata.json instead of downloading")
+    parser.add_argument("--threshold", type=float, help="minimum confidence to publish (default: the page's)")
+    parser.add_argument("--interval-ms", type=float, help="publish throttle (default: the page's)")
+    parser.add_argument("--posenet", help="pose mode only: SavedModel of the tfjs MobileNetV1 PoseNet with the "
+                                          "multiplier/outputStride in the model's metadata.json (see README)")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=available_cores(),
+                        help="worker processes, each loading its own TensorFlow runtime and model "
+                             "(memory grows per worker; default: available cores)")
+    args = parser.parse_args(argv)
+    if not Path(args.clips).is_dir():
+        parser.error(f"clips directory {args.clips} does not exist")
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    check_dependencies(args.mode)
+    cfg = page_config(PAGES[args.mode])
+    threshold = args.threshold if args.threshold is not None else cfg.get("PROB_THRESHOLD", 0.0)
+    interval_ms = args.interval_ms if args.interval_ms is not None else \
+        cfg.get("SEND_INTERVAL_MS", cfg.get("INTERVAL_MS"))
+    if args.mode == "pose" and not args.posenet:
+        parser.error("pose mode needs --posenet (tmPose classifies PoseNet outputs, not pixels)")
+
+    clips = collect_clips(args.clips, args.mode)
+    if not clips:
+        parser.error(f"no clips found under {args.clips}")
+    model_dir = Path(args.model_dir) if args.model_dir else fetch_model(args.model_id or cfg["MODEL_ID"])
+    if args.mode == "pose":
+        arch = posenet_settings(json.loads((model_dir / "metadata.json").read_text()))["architecture"]
+        if arch != "MobileNetV1":
+            raise SystemExit(f"pose model uses a {arch} PoseNet; only MobileNetV1 is supported")
+    workers = max(1, min(args.workers, len(clips)))
+    print(f"{args.mode}: model {args.model_id or args.model_dir or cfg['MODEL_ID']}  "
+          f"threshold {threshold}  interval {interval_ms}ms")
+
+    # fewer clips than cores: give each worker's TensorFlow the spare cores
+    threads = max(1, available_cores() // workers)
+    ctx = get_context("spawn")
+    jobs = [(path, truth, threshold, interval_ms) for path, truth in clips]
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                             initargs=(ctx.Barrier(workers), threads, args.mode, cfg, model_dir,
+                                       args.posenet, args.batch_size)) as pool:
+        problems = set(pool.map(_warm, range(workers))) - {None}
+        if problems:
+            raise SystemExit("\n".join(sorted(problems)))
+        start = time.perf_counter()
+        results = list(pool.map(_run_clip, jobs))
+    if not report(results, time.perf_counter() - start, start - started, workers):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
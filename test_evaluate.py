@@ -0,0 +1,219 @@
+import wave
+
+import numpy as np
+import pytest
+
+import evaluate
+
+
+def write_wav(path, frames, width, rate=evaluate.AUDIO_RATE, channels=1):
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(width)
+        wav.setframerate(rate)
+        wav.writeframes(frames)
+
+
+# ---------- CONFIG parsing ----------
+
+def test_page_config_reads_the_real_pages():
+    image = evaluate.page_config(evaluate.PAGES["image"])
+    pose = evaluate.page_config(evaluate.PAGES["pose"])
+    voice = evaluate.page_config(evaluate.PAGES["voice"])
+
+    assert image["MODEL_ID"] == "BbrydeS5D"
+    assert (image["VIDEO_W"], image["VIDEO_H"]) == (640, 480)
+    assert image["SEND_INTERVAL_MS"] == 500
+    assert pose["MODEL_ID"] == "rveXhwfWN"
+    assert (pose["VIDEO_W"], pose["VIDEO_H"]) == (320, 240)
+    assert voice["MODEL_ID"] == "w1r0IFtGQ"
+    assert voice["PROB_THRESHOLD"] == 0.75
+    assert voice["INTERVAL_MS"] == 1000
+
+
+def test_page_config_skips_non_literals(tmp_path):
+    page = tmp_path / "page.py"
+    page.write_text('import streamlit as st\nA = 1\nB = f"x/{A}"\nW, H = 2, 3\nst.title("t")\n')
+    assert evaluate.page_config(page) == {"A": 1, "W": 2, "H": 3}
+
+
+# ---------- publish throttle ----------
+
+def test_publish_on_label_change_within_interval():
+    times = [0, 100, 200, 601, 700]
+    labels = ["F", "F", "L", "L", "L"]
+    sent = evaluate.simulate_publishes(times, labels, [1.0] * 5, 0.0, 500)
+    # L repeats 401ms and 500ms after it was sent, neither beyond the 500ms interval
+    assert sent == ["F", "L"]
+
+
+def test_publish_interval_is_strictly_greater():
+    sent = evaluate.simulate_publishes([0, 500, 501], ["S", "S", "S"], [1.0] * 3, 0.0, 500)
+    assert sent == ["S", "S"]
+
+
+def test_publish_respects_threshold_and_empty_label():
+    times = [0, 10, 20, 30]
+    labels = ["F", "L", "", "L"]
+    probs = [0.9, 0.5, 0.9, 0.8]
+    sent = evaluate.simulate_publishes(times, labels, probs, 0.75, 1000)
+    # low-confidence L is dropped without touching lastLabel, so the later L still goes out
+    assert sent == ["F", "L"]
+
+
+# ---------- decoding helpers ----------
+
+def test_crop_to_aspect_centres():
+    frame = np.arange(4 * 8).reshape(4, 8)
+    assert evaluate.crop_to_aspect(frame, 1.0).tolist() == frame[:, 2:6].tolist()
+    assert evaluate.crop_to_aspect(frame.T, 1.0).shape == (4, 4)
+
+
+@pytest.mark.parametrize("frame_wh, video_wh, window", [
+    # (frame w, h), page (VIDEO_W, VIDEO_H), expected (top, left, rows, cols) before mirroring
+    ((640, 480), (640, 480), (0, 80, 360, 480)),    # image page
+    ((640, 480), (320, 240), (0, 80, 360, 480)),    # pose page
+    ((320, 240), (320, 240), (0, 40, 180, 240)),
+    ((480, 640), (640, 480), (80, 0, 360, 480)),    # portrait recording
+])
+def test_webcam_canvas_keeps_top_of_centre_square(frame_wh, video_wh, window):
+    w, h = frame_wh
+    frame = np.arange(w * h).reshape(h, w)
+    top, left, rows, cols = window
+    expected = frame[top:top + rows, left:left + cols][:, ::-1]
+    assert evaluate.webcam_canvas(frame, *video_wh).tolist() == expected.tolist()
+
+
+def test_image_crop_is_centre_square_of_canvas():
+    frame = np.arange(640 * 480).reshape(480, 640)
+    crop = evaluate.crop_to_aspect(evaluate.webcam_canvas(frame, 640, 480), 1.0)
+    # 360x360 taken from columns 140..500 of the frame, mirrored
+    assert crop.tolist() == frame[0:360, 140:500][:, ::-1].tolist()
+
+
+@pytest.mark.parametrize("width", [1, 2, 3, 4])
+def test_read_wav_bit_depths(tmp_path, width):
+    values = np.array([0.0, 0.5, -0.5])
+    scale = 2 ** (8 * width - 1) - 1
+    if width == 1:
+        raw = (values * 127 + 128).astype(np.uint8).tobytes()
+    else:
+        ints = (values * scale).astype(np.int64)
+        raw = b"".join(int(v).to_bytes(width, "little", signed=True) for v in ints)
+    path = tmp_path / "clip.wav"
+    write_wav(path, raw, width)
+    assert evaluate.read_wav(path) == pytest.approx(values, abs=0.01)
+
+
+def test_stream_audio_window_count_and_shape(tmp_path):
+    frames, bins = 43, 232
+    count = 100                                   # analyser frames in the clip
+    samples = (np.sin(np.arange(count * evaluate.FFT_SIZE) * 0.05) * 10000).astype(np.int16)
+    path = tmp_path / "clip.wav"
+    write_wav(path, samples.tobytes(), 2)
+
+    batches = list(evaluate.stream_audio(path, 2, frames, bins))
+    times = np.concatenate([t for t, _ in batches])
+    windows = np.concatenate([b for _, b in batches])
+
+    hop = evaluate.js_round(frames * (1 - evaluate.OVERLAP_FACTOR))
+    assert len(windows) == len(range(0, count - frames + 1, hop))
+    assert windows.shape[1:] == (frames, bins, 1)
+    assert [len(b) for _, b in batches][:-1] == [2] * (len(batches) - 1)
+    assert np.all(np.diff(times) > 0)
+    assert windows[0].mean() == pytest.approx(0, abs=1e-4)
+
+
+@pytest.mark.parametrize("x, expected", [(20.5, 21), (21.5, 22), (22.5, 23), (21.4, 21), (-0.5, 0)])
+def test_js_round_matches_math_round(x, expected):
+    assert evaluate.js_round(x) == expected
+
+
+def test_stream_audio_too_short(tmp_path):
+    path = tmp_path / "clip.wav"
+    write_wav(path, np.zeros(evaluate.FFT_SIZE * 10, np.int16).tobytes(), 2)
+    with pytest.raises(evaluate.ClipError, match="too short"):
+        list(evaluate.stream_audio(path, 4, 43, 232))
+
+
+# ---------- clip errors ----------
+
+def _stream(*batches, error=None):
+    def stream(path):
+        yield from batches
+        if error:
+            raise error
+    return stream
+
+
+def test_run_clip_skips_decode_errors(monkeypatch):
+    batch = (np.array([0.0]), np.zeros((1, 2)))
+    monkeypatch.setattr(evaluate, "_worker", {
+        "labels": ["F", "S"],
+        "stream": _stream(batch, error=evaluate.ClipError("cannot open video x.mp4")),
+        "predict": lambda b: np.array([[0.9, 0.1]]),
+    })
+    result = evaluate._run_clip(("x.mp4", "F", 0.0, 500))
+    assert result["error"] == "ClipError: cannot open video x.mp4"
+
+
+def test_run_clip_propagates_inference_errors(monkeypatch):
+    def predict(batch):
+        raise ValueError("expected input shape (None, 14739)")
+
+    batch = (np.array([0.0]), np.zeros((1, 2)))
+    monkeypatch.setattr(evaluate, "_worker", {"labels": ["F"], "stream": _stream(batch), "predict": predict})
+    with pytest.raises(ValueError, match="14739"):
+        evaluate._run_clip(("x.mp4", "F", 0.0, 500))
+
+
+def test_report_fails_on_skipped_or_empty(capsys):
+    ok = {"truth": "F", "predicted": ["F"], "below_threshold": 0, "published": ["F"], "infer_s": 0.1}
+    bad = {"path": "y.wav", "truth": "F", "error": "ClipError: too short"}
+    assert evaluate.report([ok], 1.0, 0.0, 1) is True
+    assert evaluate.report([ok, bad], 1.0, 0.0, 1) is False
+    assert evaluate.report([bad], 1.0, 0.0, 1) is False
+    assert "skipped y.wav: ClipError: too short" in capsys.readouterr().out
+
+
+# ---------- PoseNet checks ----------
+
+SETTINGS = {"architecture": "MobileNetV1", "outputStride": 16, "inputResolution": 257, "multiplier": 0.75}
+OUTPUTS = [(None, 17, 17, 17), (None, 17, 17, 34), (None, 17, 17, 32), (None, 17, 17, 32)]
+
+
+def test_posenet_settings_defaults_and_metadata():
+    assert evaluate.posenet_settings({}) == SETTINGS
+    meta = {"modelSettings": {"posenet": {"outputStride": 8}}}
+    assert evaluate.posenet_settings(meta)["outputStride"] == 8
+
+
+def test_check_posenet_accepts_matching_model():
+    assert evaluate.check_posenet(SETTINGS, (None, 257, 257, 3), OUTPUTS, 17 * 17 * 51) is None
+    assert evaluate.check_posenet(SETTINGS, (1, None, None, 3), [(1, None, None, 17), (1, None, None, 34)],
+                                  17 * 17 * 51) is None
+
+
+@pytest.mark.parametrize("input_shape, outputs, features, message", [
+    ((None, 353, 353, 3), OUTPUTS, 14739, "inputs"),
+    ((None, 257, 257, 3), [(None, 33, 33, 17), (None, 33, 33, 34)], 14739, "grid"),
+    ((None, 257, 257, 3), OUTPUTS, 1000, "features"),
+    ((None, 257, 257, 3), [(None, 17, 17, 10)], 14739, "heatmap"),
+])
+def test_check_posenet_rejects_mismatch(input_shape, outputs, features, message):
+    assert message in evaluate.check_posenet(SETTINGS, input_shape, outputs, features)
+
+
+# ---------- command line ----------
+
+@pytest.mark.parametrize("extra, message", [
+    ([], "does not exist"),
+    (["--batch-size", "0"], "--batch-size"),
+    (["--workers", "-1"], "--workers"),
+])
+def test_main_rejects_bad_arguments(tmp_path, capsys, extra, message):
+    clips = str(tmp_path / "missing") if not extra else str(tmp_path)
+    with pytest.raises(SystemExit) as exit_info:
+        evaluate.main(["voice", clips, *extra])
+    assert exit_info.value.code == 2
+    assert message in capsys.readouterr().err